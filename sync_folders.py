@@ -1,10 +1,22 @@
 import os
-import filecmp
+import sys
 import shutil
+import tempfile
+import select
+import errno
 from stat import *
 
 import time
 import argparse
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import groupby
+from functools import partial
+from operator import itemgetter
+
+# bound once, these are called for every entry of the tree
+from os.path import join as _join, islink as _islink, dirname as _dirname, basename as _basename, isdir as _isdir, relpath as _relpath, normpath as _normpath
 
 def parse_arguments():
     '''Takes the command line arguments and creates a sync object with them.'''
@@ -12,11 +24,480 @@ def parse_arguments():
     
     parser.add_argument("src_path", type=str, help="Source file path")
     parser.add_argument("repl_path", type=str, help="Replica file path")
-    parser.add_argument("--interval", type=int, help="Sync interval in seconds")
+    parser.add_argument("--interval", type=int, required=True, help="Sync interval in seconds")
     parser.add_argument("--log_file", type=str, help="Log file path")
+    parser.add_argument("--watch", action="store_true", help="Sync on file system change notifications instead of rescanning every interval")
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument("--verbose", action="store_true", help="Print every file action to the console")
+    output.add_argument("--quiet", action="store_true", help="No console output, only the log file")
+    mtime = parser.add_mutually_exclusive_group()
+    mtime.add_argument("--trust_mtime", dest="trust_mtime", action="store_true", default=True, help="Treat files with the same size and modification time as unchanged without reading them (default)")
+    mtime.add_argument("--no_trust_mtime", dest="trust_mtime", action="store_false", help="Compare the contents of every file with the same size")
 
     args = parser.parse_args()
-    return SyncObject(Folder(args.src_path), Folder(args.repl_path), args.interval, args.log_file, "test")
+    return SyncObject(Folder(args.src_path), Folder(args.repl_path), args.interval, args.log_file, "test", watch=args.watch, trust_mtime=args.trust_mtime, verbose=args.verbose, quiet=args.quiet)
+
+# file actions in the order they are applied within one replica folder
+# (deletions first, so a folder can replace a file of the same name and vice versa)
+ACTION_DELETE, ACTION_CREATE, ACTION_COPY = 0, 1, 2
+
+# console progress line is refreshed every this many file actions
+PROGRESS_EVERY = 100
+
+# longest wait on the change watcher before checking for a stop request (s)
+STOP_CHECK_INTERVAL = 0.5
+
+# log message templates by file action type
+LOG_TEMPLATES = {"create": "Created file: {}\n", "copy": "Copied file: {}\n", "delete": "Deleted file: {}\n"}
+
+def scan_folder(path, uncopyable=False):
+    '''Scans a folder once and returns its entries. 
+    Inputs: 
+        - path: folder path (string)
+        - uncopyable: also list dangling symlinks and special files (Bool)
+    Returns a dict of entry name -> (is directory (Bool), stat result) using the stats cached by os.scandir.
+    Symlinks are followed, as they are when copying. Dangling symlinks and special files (FIFOs, sockets, devices) have nothing 
+    to copy and are skipped, unless uncopyable is set: the replica lists them, dangling symlinks as plain files with the stats 
+    of the link itself, so they get deleted or replaced rather than written through.
+    '''
+    entries = {}
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                is_dir, st = entry.is_dir(), entry.stat()
+            except OSError: # dangling symlink or removed in the meantime
+                if not uncopyable:
+                    continue
+                try:
+                    is_dir, st = entry.is_dir(follow_symlinks=False), entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue # removed in the meantime
+            # opening a special file could block (FIFO) -> only folders and regular files are ever copied
+            if uncopyable or is_dir or S_ISREG(st.st_mode):
+                entries[entry.name] = (is_dir, st)
+    return entries
+
+def files_equal(a, b, bufsize=64 * 1024):
+    '''Byte comparison of two files of equal size. 
+    Inputs: 
+        - a, b: file paths (string)
+    '''
+    with open(a, 'rb') as fa, open(b, 'rb') as fb:
+        while True:
+            chunk_a = fa.read(bufsize)
+            if chunk_a != fb.read(bufsize):
+                return False
+            if not chunk_a:
+                return True
+
+# content hashing (optional, falls back to a byte comparison without it)
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+    try:
+        import blake3
+    except ImportError:
+        blake3 = None
+
+HASH_CHUNK_SIZE = 4 * 1024 * 1024
+
+# folder comparisons are bound by stat/open latency -> overlap them on more threads than cores
+COMPARE_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+def file_digest(path):
+    '''Hashes a file with xxh3 (or BLAKE3), reading it into one reused buffer in 4 MiB chunks. 
+    Reading (rather than mapping) keeps a file that is truncated or grows while being hashed safe: it just gets another digest.
+    Input: 
+        - path: file path (string)
+    Returns None if no hash library is available.
+    '''
+    if xxhash is not None:
+        hasher = xxhash.xxh3_64()
+    elif blake3 is not None:
+        hasher = blake3.blake3()
+    else:
+        return None
+    buffer = bytearray(HASH_CHUNK_SIZE)
+    with open(path, 'rb', buffering=0) as f, memoryview(buffer) as view:
+        while True:
+            n = f.readinto(view)
+            if not n:
+                break
+            hasher.update(view[:n])
+    return hasher.digest()
+
+# native Windows copy (copy-on-write aware, keeps timestamps and attributes)
+if sys.platform == "win32":
+    import ctypes
+    _CopyFile2 = ctypes.windll.kernel32.CopyFile2
+    _CopyFile2.argtypes = (ctypes.c_wchar_p, ctypes.c_wchar_p, ctypes.c_void_p)
+else:
+    _CopyFile2 = None
+
+# copy-on-write clones on Linux (btrfs, XFS, ...)
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+FICLONE = 0x40049409
+
+def clone_copy(src, dst):
+    '''Copies file contents inside the kernel: first as a reflink sharing the source extents (FICLONE), 
+    then with copy_file_range, which also reflinks opportunistically on newer kernels. 
+    Inputs: 
+        - src: source file path (string)
+        - dst: destination file path (string)
+    Returns False if the file system supports neither, in which case the caller copies the file another way.
+    '''
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        in_fd, out_fd = fsrc.fileno(), fdst.fileno()
+        try:
+            fcntl.ioctl(out_fd, FICLONE, in_fd)
+            return True
+        except OSError:
+            pass # EXDEV (other file system), EOPNOTSUPP, ... -> try copy_file_range
+        if not hasattr(os, "copy_file_range"):
+            return False
+        size = remaining = os.fstat(in_fd).st_size
+        try:
+            while remaining > 0:
+                copied = os.copy_file_range(in_fd, out_fd, remaining)
+                if copied == 0:
+                    if remaining == size:
+                        # nothing copied at all -> not supported by this file system
+                        return False
+                    break # the file shrank while being copied
+                remaining -= copied
+        except OSError as e:
+            if e.errno in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP):
+                return False
+            raise
+    return True
+
+def sendfile_copy(src, dst):
+    '''Copies file contents in kernel space with os.sendfile. 
+    Inputs: 
+        - src: source file path (string)
+        - dst: destination file path (string)
+    '''
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        in_fd, out_fd = fsrc.fileno(), fdst.fileno()
+        remaining = os.fstat(in_fd).st_size
+        offset = 0
+        while remaining > 0:
+            sent = os.sendfile(out_fd, in_fd, offset, remaining)
+            if sent == 0:
+                break
+            offset += sent
+            remaining -= sent
+
+def copy_file(src, dst):
+    '''Copies a file with its metadata using the fastest path available on the platform. 
+    Inputs: 
+        - src: source file path (string)
+        - dst: destination file path (string)
+    '''
+    if _CopyFile2 is not None:
+        # CopyFile2 returns an HRESULT, 0 is S_OK
+        if _CopyFile2(src, dst, None) == 0:
+            return dst
+    elif fcntl is not None and sys.platform.startswith("linux"):
+        # let the kernel share or copy the data (fails with EXDEV across file systems, no stat needed up front)
+        if clone_copy(src, dst):
+            shutil.copystat(src, dst)
+            return dst
+    if sys.platform.startswith("linux") and not getattr(shutil, "_USE_CP_SENDFILE", False):
+        # shutil has disabled its own sendfile path -> do it manually
+        sendfile_copy(src, dst)
+        shutil.copystat(src, dst)
+        return dst
+    # shutil.copy2 already uses sendfile / fcopyfile where it can
+    return shutil.copy2(src, dst)
+
+# suffix of the temporary file an updated replica file is written to before replacing it
+TMP_SUFFIX = ".synctmp"
+
+def replace_atomically(make, src, dst):
+    '''Creates a file next to dst (same folder, so same file system) and renames it over dst with os.replace. 
+    The replica file is swapped in one step instead of being truncated and rewritten, and is never left half written. 
+    Inputs: 
+        - make: function creating the file over the reserved empty temporary file, called as make(src, tmp) (e.g. copy_file, link_file)
+        - src: source file path (string)
+        - dst: destination file path (string)
+    '''
+    # unique hidden name, so it cannot clash with a synced entry (e.g. a source file or folder named like the temporary file)
+    fd, tmp = tempfile.mkstemp(suffix=TMP_SUFFIX, prefix="." + _basename(dst) + ".", dir=_dirname(dst))
+    os.close(fd)
+    try:
+        make(src, tmp)
+        os.replace(tmp, dst)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    return dst
+
+def link_file(src, dst):
+    '''Replaces a file with a hard link to another one. 
+    Inputs: 
+        - src: linked file path (string)
+        - dst: path of the file to replace (string)
+    '''
+    os.unlink(dst)
+    os.link(src, dst)
+
+def atomic_copy(src, dst):
+    '''Copies a file over an existing one atomically. 
+    Inputs: 
+        - src: source file path (string)
+        - dst: destination file path (string)
+    '''
+    return replace_atomically(copy_file, src, dst)
+
+
+# file system change watchers (optional, the sync falls back to polling without them)
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:
+    INotify = None
+
+try:
+    import pywintypes
+    import win32con
+    import win32event
+    import win32file
+except ImportError:
+    win32file = None
+
+class WatchLimitReached(OSError):
+    '''Raised by a change watcher that cannot watch any more folders; the sync then falls back to polling.'''
+
+
+# file systems on which change notifications are missing or unreliable
+NETWORK_FS_TYPES = {"nfs", "nfs4", "cifs", "smb3", "smbfs", "fuse.sshfs", "9p"}
+
+def is_network_fs(path):
+    '''Checks whether a path lives on a network file system (NFS/CIFS/...).
+    Input: 
+        - path: folder path (string)
+    '''
+    if sys.platform == "win32":
+        import ctypes
+        drive = os.path.splitdrive(os.path.abspath(path))[0] + "\\"
+        return drive.startswith("\\\\") or ctypes.windll.kernel32.GetDriveTypeW(drive) == 4 # DRIVE_REMOTE
+    if not sys.platform.startswith("linux"):
+        return False
+    # find the longest mount point containing the path
+    path = os.path.realpath(path)
+    fs_type, mount_len = "", -1
+    try:
+        with open("/proc/mounts") as mounts:
+            for line in mounts:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                mount_point = fields[1].replace("\\040", " ")
+                if (path == mount_point or path.startswith(mount_point.rstrip("/") + "/")) and len(mount_point) > mount_len:
+                    fs_type, mount_len = fields[2], len(mount_point)
+    except OSError:
+        return False
+    return fs_type in NETWORK_FS_TYPES
+
+
+class InotifyWatcher:
+    '''
+    Linux change watcher based on inotify_simple. inotify is not recursive, so every folder gets its own watch.
+    Attributes:
+        - inotify (INotify): inotify instance
+        - watches (dict): watch descriptor -> folder path
+    '''
+    def __init__(self, root):
+        '''Constructor for the inotify watcher, watches root and all its subfolders'''
+        self.inotify = INotify()
+        self.mask = inotify_flags.CREATE | inotify_flags.MODIFY | inotify_flags.DELETE | inotify_flags.MOVED_TO | inotify_flags.MOVED_FROM
+        self.watches = {}
+        self.add_tree(root)
+
+    def add_tree(self, path):
+        '''Adds watches for a folder and all its subfolders'''
+        for folder, _, _ in os.walk(path):
+            try:
+                self.watches[self.inotify.add_watch(folder, self.mask)] = folder
+            except OSError as e:
+                if e.errno == errno.ENOSPC:
+                    # fs.inotify.max_user_watches reached
+                    raise WatchLimitReached(str(e)) from e
+                # folder removed in the meantime
+
+    def read(self, timeout):
+        '''Waits up to timeout seconds for changes. Returns the set of changed folders, or None if events were lost.'''
+        changed = set()
+        for event in self.inotify.read(timeout=int(timeout * 1000), read_delay=100):
+            if event.mask & inotify_flags.Q_OVERFLOW:
+                return None
+            if event.mask & inotify_flags.IGNORED:
+                self.watches.pop(event.wd, None)
+                continue
+            folder = self.watches.get(event.wd)
+            if folder is None:
+                continue
+            changed.add(folder)
+            if event.mask & inotify_flags.ISDIR and event.mask & (inotify_flags.CREATE | inotify_flags.MOVED_TO):
+                self.add_tree(_join(folder, event.name))
+        return changed
+
+    def close(self):
+        self.inotify.close()
+
+
+class WindowsWatcher:
+    '''
+    Windows change watcher based on ReadDirectoryChangesW (pywin32), watching the whole tree with one handle.
+    Attributes:
+        - root (string): watched folder path
+        - handle: directory handle
+        - overlapped: overlapped structure used to wait with a timeout
+    '''
+    FILTER = (win32con.FILE_NOTIFY_CHANGE_FILE_NAME | win32con.FILE_NOTIFY_CHANGE_DIR_NAME
+              | win32con.FILE_NOTIFY_CHANGE_SIZE | win32con.FILE_NOTIFY_CHANGE_LAST_WRITE) if win32file else 0
+
+    def __init__(self, root):
+        '''Constructor for the Windows watcher'''
+        self.root = root
+        self.handle = win32file.CreateFile(
+            root, 0x0001, # FILE_LIST_DIRECTORY
+            win32con.FILE_SHARE_READ | win32con.FILE_SHARE_WRITE | win32con.FILE_SHARE_DELETE,
+            None, win32con.OPEN_EXISTING,
+            win32con.FILE_FLAG_BACKUP_SEMANTICS | win32con.FILE_FLAG_OVERLAPPED, None)
+        self.overlapped = pywintypes.OVERLAPPED()
+        self.overlapped.hEvent = win32event.CreateEvent(None, True, False, None)
+        self.buffer = win32file.AllocateReadBuffer(64 * 1024)
+        self.arm()
+
+    def arm(self):
+        '''Starts the next asynchronous read of change notifications'''
+        win32file.ReadDirectoryChangesW(self.handle, self.buffer, True, self.FILTER, self.overlapped)
+
+    def read(self, timeout):
+        '''Waits up to timeout seconds for changes. Returns the set of changed folders, or None if events were lost.'''
+        if win32event.WaitForSingleObject(self.overlapped.hEvent, int(timeout * 1000)) != win32event.WAIT_OBJECT_0:
+            return set()
+        size = win32file.GetOverlappedResult(self.handle, self.overlapped, True)
+        win32event.ResetEvent(self.overlapped.hEvent)
+        # an empty result means the notification buffer overflowed
+        changes = win32file.FILE_NOTIFY_INFORMATION(self.buffer, size) if size else None
+        self.arm()
+        if changes is None:
+            return None
+        return {_dirname(_join(self.root, name)) for _, name in changes}
+
+    def close(self):
+        self.handle.Close()
+
+
+class KqueueWatcher:
+    '''
+    macOS/BSD change watcher based on kqueue. kqueue watches file descriptors, so only folders are watched (one open 
+    descriptor each, capped to half the open file limit): added, removed and renamed entries are reported, changes to 
+    the contents of existing files are picked up by the full sync every interval.
+    Attributes:
+        - kq (kqueue): kqueue instance
+        - fds (dict): file descriptor -> folder path
+        - paths (dict): folder path -> file descriptor
+        - limit (int): maximum number of watched folders
+    '''
+    FFLAGS = (select.KQ_NOTE_WRITE | select.KQ_NOTE_DELETE | select.KQ_NOTE_RENAME) if hasattr(select, "kqueue") else 0
+
+    def __init__(self, root):
+        '''Constructor for the kqueue watcher, watches root and all its subfolders'''
+        import resource
+        self.kq = select.kqueue()
+        self.fds = {}
+        self.paths = {}
+        # leave the other half of the descriptors to the sync itself
+        self.limit = resource.getrlimit(resource.RLIMIT_NOFILE)[0] // 2
+        try:
+            self.add_tree(root)
+        except OSError:
+            self.close()
+            raise
+
+    def add(self, folder):
+        '''Starts watching a single folder'''
+        if folder in self.paths:
+            return
+        if len(self.fds) >= self.limit:
+            raise WatchLimitReached(f"more than {self.limit} folders to watch")
+        try:
+            fd = os.open(folder, getattr(os, "O_EVTONLY", os.O_RDONLY))
+        except OSError as e:
+            if e.errno in (errno.EMFILE, errno.ENFILE):
+                raise WatchLimitReached(str(e)) from e
+            return # folder removed in the meantime
+        self.paths[folder] = fd
+        self.fds[fd] = folder
+        self.kq.control([select.kevent(fd, select.KQ_FILTER_VNODE, select.KQ_EV_ADD | select.KQ_EV_CLEAR, self.FFLAGS)], 0)
+
+    def add_tree(self, path):
+        '''Starts watching a folder and all its subfolders'''
+        for folder, _, _ in os.walk(path):
+            self.add(folder)
+
+    def remove(self, fd):
+        '''Stops watching a file descriptor'''
+        folder = self.fds.pop(fd)
+        del self.paths[folder]
+        os.close(fd)
+
+    def read(self, timeout):
+        '''Waits up to timeout seconds for changes. Returns the set of changed folders.'''
+        changed = set()
+        for event in self.kq.control(None, 64, timeout):
+            folder = self.fds.get(event.ident)
+            if folder is None:
+                continue
+            if event.fflags & (select.KQ_NOTE_DELETE | select.KQ_NOTE_RENAME):
+                self.remove(event.ident)
+                changed.add(_dirname(folder))
+                continue
+            changed.add(folder)
+            # folder entries changed -> watch new subfolders
+            try:
+                with os.scandir(folder) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False) and entry.path not in self.paths:
+                            self.add_tree(entry.path)
+            except FileNotFoundError:
+                pass
+        return changed
+
+    def close(self):
+        for fd in list(self.fds):
+            self.remove(fd)
+        self.kq.close()
+
+
+def make_watcher(root):
+    '''Creates the change watcher for the platform. 
+    Input: 
+        - root: folder path to watch (string)
+    Returns None if no watcher is available or the folder is on a network file system, in which case the sync keeps polling.
+    '''
+    if is_network_fs(root):
+        return None
+    try:
+        if sys.platform.startswith("linux") and INotify is not None:
+            return InotifyWatcher(root)
+        if sys.platform == "win32" and win32file is not None:
+            return WindowsWatcher(root)
+        if hasattr(select, "kqueue"):
+            return KqueueWatcher(root)
+    except OSError:
+        pass
+    return None
 
 
 class Folder:
@@ -24,13 +505,18 @@ class Folder:
     This is a class for a folder.
     Attributes:
         - Path
-        - File list
+        - File list (read on access, never cached)
     '''
     def __init__(self, path, name=""):
         ''' Constructor for folder class'''
         self.name = name
         self.root_path = os.path.abspath(path)
-        self.file_list = os.listdir(self.root_path)
+
+    @property
+    def file_list(self):
+        '''Current folder contents, scanned on every access so it cannot go stale'''
+        with os.scandir(self.root_path) as it:
+            return [entry.name for entry in it]
 
 class SyncObject:
     '''
@@ -39,154 +525,448 @@ class SyncObject:
         - source (Folder): Source folder
         - replica (Folder): Replica folder
         - log_file (string) : Log file path
+        - log_fh (file) : Open log file handle, flushed after every sync
+        - digest_cache (dict) : Replica file digests, reused across syncs
+        - counts (list) : File action counts of the current sync, indexed by ACTION_DELETE, ACTION_CREATE, ACTION_COPY
         - file_created_count (int)
         - file_copied_count (int)
         - file_deleted_count (int)
     Methods:
         - __init__: Constructor
         - compare_root: Start sync
+        - watch_changes: Syncs on change notifications (watch mode)
+        - stop: Stops the sync loop
+        - sync_all: Syncs the whole folder once
+        - sync_path: Syncs a single changed folder (watch mode)
+        - end_sync: Logs and resets the file action count
+        - summary: File action count as a string
         - compare_folders: Directory comparison, recursive
+        - compare_level: Single folder comparison
+        - apply_batch: Applies the file actions of one folder
+        - same_contents: Compares file contents by hash
         - write_log: Writes actions to log file
         - copy_files: Creates and copies files
+        - copy_or_link: Copies a file or recreates its hard link
+        - copy_tree: Copies a folder recursively
         - delete_files: Deletes files
     '''
 
-    def __init__(self, source, replica, interval, log_file, name=""):
+    def __init__(self, source, replica, interval, log_file, name="", watch=False, trust_mtime=True, verbose=False, quiet=False):
         '''Constructor for sync class. 
         Inputs: 
         - source: source folder (Folder)
         - replica: replica folder (Folder)
         - interval: interval time (int)
         - log_file: log file path (string)
+        - watch: sync on change notifications instead of polling (Bool)
+        - trust_mtime: treat files with the same size and modification time as unchanged (Bool)
+        - verbose: print every file action to the console (Bool)
+        - quiet: no console output (Bool)
         '''
         self.name = name
+        self.watch = watch
+        self.trust_mtime = trust_mtime
+        self.verbose = verbose
+        self.quiet = quiet
+        # by default only a progress line (on a terminal) and the summary per sync are printed
+        self.progress = not (verbose or quiet) and sys.stdout.isatty()
         self.source = source
         self.replica = replica
         self.interval = interval
         self.log_file = os.path.abspath(log_file)
+        # log file opened in append mode, assuming we'd want continuous logging for continuous syncing
+        # kept open for the whole run and flushed once per sync instead of reopened for every file action
+        self.log_fh = open(self.log_file, 'a', buffering=1 << 16)
+
+        self.counts = [0, 0, 0]
+        self.lock = threading.Lock()
+        # set to end compare_root
+        self._stop = threading.Event()
+        # file action type -> logging helper, built once instead of comparing the type on every call
+        self._actions = {
+            "create": partial(self._log, ACTION_CREATE, LOG_TEMPLATES["create"]),
+            "copy": partial(self._log, ACTION_COPY, LOG_TEMPLATES["copy"]),
+            "delete": partial(self._log, ACTION_DELETE, LOG_TEMPLATES["delete"]),
+        }
 
-        self.file_created_count = 0
-        self.file_copied_count = 0
-        self.file_deleted_count = 0
+        # source (device, inode) -> replica path copied in this sync, to recreate hard links instead of copying again
+        self._inode_map = {}
+
+        # replica file digests by (device, inode, mtime, size) from the previous and the current full sync, rotated in sync_all
+        self.digest_cache = {}
+        self.digest_cache_next = {}
 
     def compare_root(self):
-        '''Starts sync and logs this to console. Ends one sync by logging a count of file actions to the console and resetting the count. Repeats every interval'''
-        while True:     
-            # start sync
-            print("Syncing " + self.source.root_path + " + " + self.replica.root_path)
-            self.compare_folders(self.source.root_path, self.replica.root_path)
-            print("Files created: " + str(self.file_created_count), "Files copied: " + str(self.file_copied_count), "Files deleted: " + str(self.file_deleted_count) + "\n")
-            
-            # clear after printing (if we want an overall count printed, just remove this)
-            self.file_created_count = 0
-            self.file_copied_count = 0
-            self.file_deleted_count = 0
-
-            # sleep for interval
-            time.sleep(self.interval)
-
-        
-    def compare_folders(self, src, repl):
+        '''Starts sync and logs this to console. Ends one sync by logging a count of file actions to the console and resetting the count. 
+        Repeats every interval, or on every change in the source folder in watch mode, until stop() is called.'''
+        watcher = make_watcher(self.source.root_path) if self.watch else None
+        if self.watch and watcher is None and not self.quiet:
+            sys.stdout.write(f"Change notifications not available for {self.source.root_path}, falling back to polling\n")
+
+        try:
+            self.sync_all()
+            if watcher is not None:
+                # returns once stopped, or when the watcher gives up -> keep polling below
+                self.watch_changes(watcher)
+
+            # wait for interval (returns early once stopped; the interval is re-read every time, so it can be changed while running)
+            while not self._stop.wait(self.interval):
+                self.sync_all()
+        finally:
+            self.log_fh.close()
+
+    def watch_changes(self, watcher):
+        '''Syncs the folders reported by the change watcher as they change, plus the whole tree every interval, which also 
+        repairs changes made directly in the replica and changes the watcher cannot see. 
+        Returns once stopped, or when the watcher runs out of watches. 
+        Input: 
+            - watcher: change watcher from make_watcher
+        '''
+        next_full_sync = time.monotonic() + self.interval
+        try:
+            while not self._stop.is_set():
+                # short waits, so a stop request is noticed while no changes come in
+                changed = watcher.read(min(max(0, next_full_sync - time.monotonic()), STOP_CHECK_INTERVAL))
+                if changed is None or time.monotonic() >= next_full_sync:
+                    # events were lost or the interval has passed -> full rescan
+                    self.sync_all()
+                    next_full_sync = time.monotonic() + self.interval
+                elif changed:
+                    for folder in sorted(changed):
+                        self.sync_path(folder)
+                    self.end_sync()
+        except WatchLimitReached:
+            if not self.quiet:
+                sys.stdout.write(f"Too many folders to watch in {self.source.root_path}, falling back to polling\n")
+        finally:
+            watcher.close()
+
+    def stop(self):
+        '''Stops the sync loop after the current sync (safe to call from a signal handler or another thread).'''
+        self._stop.set()
+
+    def sync_all(self):
+        '''Syncs the whole source folder with the replica and rotates the digest cache.'''
+        if not self.quiet:
+            sys.stdout.write(f"Syncing {self.source.root_path} + {self.replica.root_path}\n")
+        self.compare_folders(self.source.root_path, self.replica.root_path)
+        self.end_sync()
+        # only keep digests of replica files seen in this or the previous full sync
+        # (not after the partial syncs of watch mode, which run between the full syncs every interval)
+        self.digest_cache, self.digest_cache_next = self.digest_cache_next, {}
+
+    def sync_path(self, subdir):
+        '''Syncs a single changed source folder (without its common subfolders) with its replica counterpart. 
+        Input: 
+            - subdir: changed source folder path (string)
+        '''
+        rel = _relpath(subdir, self.source.root_path)
+        if rel == os.pardir or rel.startswith(os.pardir + os.sep):
+            return
+        src = _normpath(subdir)
+        repl = _normpath(_join(self.replica.root_path, rel))
+        # the folder may have been created or removed since the event -> sync the closest folder existing on both sides
+        while not (_isdir(src) and _isdir(repl)):
+            if src == self.source.root_path:
+                return
+            src, repl = _dirname(src), _dirname(repl)
+        self.compare_folders(src, repl, recursive=False)
+
+    def end_sync(self):
+        '''Logs the count of file actions to the console, flushes the log file and resets the count.'''
+        if not self.quiet:
+            # the summary overwrites the progress line
+            sys.stdout.write(("\r" if self.progress else "") + self.summary() + "\n\n")
+        self.log_fh.flush()
+
+        # clear after printing (if we want an overall count printed, just remove this)
+        self.counts = [0, 0, 0]
+        self._inode_map = {}
+
+    @property
+    def file_created_count(self):
+        '''Files created in the current sync'''
+        return self.counts[ACTION_CREATE]
+
+    @property
+    def file_copied_count(self):
+        '''Files copied in the current sync'''
+        return self.counts[ACTION_COPY]
+
+    @property
+    def file_deleted_count(self):
+        '''Files deleted in the current sync'''
+        return self.counts[ACTION_DELETE]
+
+    def summary(self):
+        '''Returns the count of file actions as a string'''
+        return f"Files created: {self.file_created_count} Files copied: {self.file_copied_count} Files deleted: {self.file_deleted_count}"
+
+    def compare_folders(self, src, repl, recursive=True):
         '''Recursive folder comparison. Replica folder is modified accordingly to match source folder. 
+        The whole tree is compared first, collecting the file actions, then the actions are sorted by replica folder 
+        and applied one folder at a time, so consecutive operations stay in the same folder. 
+        Common subfolders (and later the per-folder batches) are independent of each other and run in parallel on a thread pool.
         Inputs: 
             - src: source path (string)
             - repl: replica path (string). 
+            - recursive: whether to also compare common subfolders (Bool)
             '''
-        compare_obj = filecmp.dircmp(src, repl) #compare with filecmp
-        
-        if compare_obj.common_dirs: 
-            # nothing different at current level -> check subdirectories
-            for folder in compare_obj.common_dirs:
-                self.compare_folders(os.path.join(src, folder), os.path.join(repl, folder)) # call recursively for subdirectories
-        
-        if compare_obj.left_only:
-            # source has files, replica does not
-            self.copy_files(compare_obj.left_only, src, repl) 
-        
-        if compare_obj.right_only:
-            # source does NOT have files, replica does
-            self.delete_files(compare_obj.right_only, repl) 
-
-        if compare_obj.diff_files: 
-            # files are the same, but contents have changed
-            self.copy_files(compare_obj.diff_files, src, repl, False)
-    
+        actions = []
+        with ThreadPoolExecutor(max_workers=COMPARE_WORKERS) as pool:
+            # every finished folder hands back its common subfolders, which are queued in turn
+            # (no worker waits on another one, so the bounded pool cannot deadlock)
+            try:
+                pending = {pool.submit(self.compare_level, src, repl, actions)}
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        common_dirs = future.result()
+                        if recursive:
+                            for sub_src, sub_repl in common_dirs:
+                                pending.add(pool.submit(self.compare_level, sub_src, sub_repl, actions))
+
+                actions.sort(key=itemgetter(0, 1, 2))
+                batches = [list(batch) for _, batch in groupby(actions, key=itemgetter(0))]
+                for future in [pool.submit(self.apply_batch, batch) for batch in batches]:
+                    future.result()
+            except BaseException:
+                # error or forced exit -> drop the queued work instead of finishing it on the way out
+                pool.shutdown(cancel_futures=True)
+                raise
+
+    def compare_level(self, src, repl, actions):
+        '''Compares a single folder level. Each side is scanned once with os.scandir and the cached DirEntry stats are reused for the comparison. 
+        Inputs: 
+            - src: source path (string)
+            - repl: replica path (string). 
+            - actions: list the file actions are added to as (replica folder, action, name, source folder, is directory, source stat) (list)
+        Returns a list of (source, replica) paths of the common subfolders.
+        '''
+        src_entries = scan_folder(src)
+        repl_entries = scan_folder(repl, uncopyable=True)
+
+        left_only = [name for name in src_entries if name not in repl_entries]
+        right_only = [name for name in repl_entries if name not in src_entries]
+        diff_files = []
+        common_dirs = []
+
+        for name, (src_is_dir, src_stat) in src_entries.items():
+            if name not in repl_entries:
+                continue
+            repl_is_dir, repl_stat = repl_entries[name]
+            if src_is_dir and repl_is_dir:
+                # same folder on both sides -> check subdirectory
+                common_dirs.append((_join(src, name), _join(repl, name)))
+            elif src_is_dir != repl_is_dir:
+                # file on one side, folder on the other -> replace replica entry
+                right_only.append(name)
+                left_only.append(name)
+            elif not S_ISREG(repl_stat.st_mode):
+                # dangling symlink or special file in the replica -> replace it with the source file (without reading it)
+                diff_files.append(name)
+            elif src_stat.st_size != repl_stat.st_size:
+                # different size -> definitely changed, no need to read
+                diff_files.append(name)
+            elif src_stat.st_mtime_ns != repl_stat.st_mtime_ns or not self.trust_mtime:
+                # same size but different modification time (or mtime not trusted) -> only now compare contents
+                if not self.same_contents(_join(src, name), _join(repl, name), src_stat, repl_stat):
+                    diff_files.append(name)
+
+        # source does NOT have files, replica does -> delete
+        # source has files, replica does not -> create
+        # files are the same, but contents have changed -> copy
+        # the scanned source stat is handed on to the copy, so it does not stat the file again
+        found = [(repl, ACTION_DELETE, name, src, repl_entries[name][0], None) for name in right_only]
+        found += [(repl, ACTION_CREATE, name, src) + src_entries[name] for name in left_only]
+        found += [(repl, ACTION_COPY, name, src) + src_entries[name] for name in diff_files]
+        actions.extend(found)
+
+        return common_dirs
+
+    def apply_batch(self, batch):
+        '''Applies the file actions of a single replica folder, deletions first. 
+        Input: 
+            - batch: sorted file actions of one folder as (replica folder, action, name, source folder, is directory, source stat) (list)
+        '''
+        repl, src = batch[0][0], batch[0][3]
+        for action, group in groupby(batch, key=itemgetter(1)):
+            entries = [(name, is_dir, st) for _, _, name, _, is_dir, st in group]
+            if action == ACTION_DELETE:
+                self.delete_files([(name, is_dir) for name, is_dir, _ in entries], repl)
+            elif action == ACTION_CREATE:
+                self.copy_files(entries, src, repl)
+            else:
+                self.copy_files(entries, src, repl, False)
+
+    def same_contents(self, src, repl, src_stat, repl_stat):
+        '''Compares the contents of a source and a replica file by hash, reusing cached replica digests. 
+        Inputs: 
+            - src: source file path (string)
+            - repl: replica file path (string)
+            - src_stat, repl_stat: stat results of both files
+        '''
+        size = src_stat.st_size
+        if size != repl_stat.st_size:
+            return False
+        if not size:
+            return True
+
+        src_digest = file_digest(src)
+        if src_digest is None:
+            # no hash library available
+            return files_equal(src, repl)
+
+        # inode numbers are not available from scandir on Windows -> no caching there
+        key = (repl_stat.st_dev, repl_stat.st_ino, repl_stat.st_mtime_ns, size) if repl_stat.st_ino else None
+        repl_digest = self.digest_cache_next.get(key) or self.digest_cache.get(key)
+        if repl_digest is None:
+            repl_digest = file_digest(repl)
+        if key is not None:
+            self.digest_cache_next[key] = repl_digest
+        return src_digest == repl_digest
+
     def write_log(self, type, file):
-        '''Opens log file, appends file actions to log file and prints them to console. 
+        '''Counts file actions and appends them to the open log file. They are printed to console in verbose mode. 
         Inputs: 
             - type: file action type (string)
             - file: file name (string)
         '''
-        # log file opened in append mode, assuming we'd want continuous logging for continuous syncing
-        # if we wanted one log file to only reflect one sync, opening in write mode in compare_root and handling only the writing in this function might be the easiest solution (each sync thus overwriting the previous log file).
-        log_file = open(self.log_file, 'a')
-        
-        # log by action taken
-        if type == "create":
-            log_file.write("Created file: " + file + "\n")
-            print("Created file: " + file)
-        elif type == "copy":
-            log_file.write("Copied file: " + file + "\n")
-            print("Copied file: " + file)
-        elif type == "delete":
-            log_file.write("Deleted file: " + file + "\n")
-            print("Deleted file: " + file)
-        else:
-            print("Error: Invalid file action") # pretty redundant for this script, but nonetheless best to have an error handler just in case
-        
-        log_file.close()
+        try:
+            log_action = self._actions[type]
+        except KeyError:
+            if not self.quiet:
+                sys.stdout.write("Error: Invalid file action\n") # pretty redundant for this script, but nonetheless best to have an error handler just in case
+            return
+        log_action(file)
 
+    def _log(self, action, template, file):
+        '''Counts and logs a file action. Called from the compare threads -> count and write under the lock. 
+        Inputs: 
+            - action: file action, the index of its count (ACTION_*)
+            - template: log message template (string)
+            - file: file name (string)
+        '''
+        message = template.format(file)
+        with self.lock:
+            self.counts[action] += 1
+            self.log_fh.write(message)
+            if self.verbose:
+                sys.stdout.write(message)
+            elif self.progress:
+                self._progress()
+
+    def _progress(self):
+        '''Overwrites the console progress line every PROGRESS_EVERY file actions (called under the lock)'''
+        if sum(self.counts) % PROGRESS_EVERY == 0:
+            sys.stdout.write("\r" + self.summary())
+            sys.stdout.flush()
 
     def copy_files(self, file_list, src, dest, new=True):
         '''Copies files. A new file is logged as creation, an edited existing file is logged as copied. 
        Inputs: 
-           - file_list: list of files to be copied (array)
+           - file_list: list of (file name, is directory, stat result) tuples from the folder scan (array)
            - src: source folder path (string)
            - dest: destination folder path (string)
            - new: whether the copied file is being created vs copied (Bool)
            '''
-        for file in file_list:
-            srcpath = os.path.join(src, os.path.basename(file))
-            if os.path.isdir(srcpath):
-                shutil.copytree(srcpath, os.path.join(dest, os.path.basename(file)))
-                if new:
-                    for file in os.listdir(srcpath):
-                        self.file_created_count += 1
-                        self.write_log("create", os.path.join(srcpath, file))
-                else:
-                    for file in os.listdir(srcpath):
-                        self.file_copied_count += 1
-                        self.write_log("copy", os.path.join(srcpath, file))
+        for file, is_dir, st in file_list:
+            srcpath = _join(src, file)
+            if is_dir:
+                self.copy_tree(srcpath, _join(dest, file), new)
             else:
-                shutil.copy2(srcpath, dest)
+                self.copy_or_link(srcpath, _join(dest, file), st, new)
+                # log to file
+                self.write_log("create" if new else "copy", srcpath)
+
+    def copy_or_link(self, srcpath, destpath, st, new=True):
+        '''Copies a file. Source files with several hard links are copied once per sync, further links to the 
+        same inode are recreated as hard links to the first replica copy. Existing replica files are replaced atomically. 
+       Inputs: 
+           - srcpath: source file path (string)
+           - destpath: destination file path (string)
+           - st: source stat result from the folder scan
+           - new: whether the destination file does not exist yet (Bool)
+           '''
+        copy = copy_file if new else atomic_copy
+        # inode numbers may be unavailable (0) on some platforms/file systems
+        if st.st_nlink < 2 or not st.st_ino:
+            copy(srcpath, destpath)
+            return
+
+        key = (st.st_dev, st.st_ino)
+        with self.lock:
+            linked = self._inode_map.get(key)
+        if linked is not None:
+            try:
                 if new:
-                    self.file_created_count += 1
-                    self.write_log("create", srcpath)
+                    os.link(linked, destpath)
                 else:
-                    self.file_copied_count += 1
-                    # log to file
-                    self.write_log("copy", srcpath)
+                    replace_atomically(link_file, linked, destpath)
+                return
+            except OSError:
+                pass # cross-device, no hard link support, ... -> copy
+        copy(srcpath, destpath)
+        with self.lock:
+            self._inode_map.setdefault(key, destpath)
+
+    def copy_tree(self, src, dest, new=True):
+        '''Recursively copies a folder in a single pass, logging every file as it is written. 
+       Inputs: 
+           - src: source folder path (string)
+           - dest: destination folder path (string)
+           - new: whether the copied files are being created vs copied (Bool)
+           '''
+        os.makedirs(dest, exist_ok=True)
+        # scanned like a compared folder, so dangling symlinks and special files are skipped the same way
+        for name, (is_dir, st) in scan_folder(src).items():
+            srcpath, destpath = _join(src, name), _join(dest, name)
+            if is_dir:
+                self.copy_tree(srcpath, destpath, new)
+                continue
+            self.copy_or_link(srcpath, destpath, st, new)
+            self.write_log("create" if new else "copy", srcpath)
+        shutil.copystat(src, dest)
 
     def delete_files(self, file_list, folder):
         '''Deletes files. 
        Inputs: 
-           - file_list: list of files to be deleted (array)
+           - file_list: list of (file name, is directory) tuples from the folder scan (array)
            - folder: path of folder files are in (string)
           '''
-        for file in file_list:
-            srcpath = os.path.join(folder, os.path.basename(file))
-            if os.path.isdir(srcpath):
-                for file in os.listdir(srcpath):
-                    self.file_deleted_count +=1 
-                    self.write_log("delete", os.path.join(srcpath, file))
-                shutil.rmtree(srcpath)
+        for file, is_dir in file_list:
+            srcpath = _join(folder, file)
+            # a symlink to a folder is removed itself, never walked into
+            if is_dir and not _islink(srcpath):
+                # single bottom-up pass: delete and log every file, then remove the emptied folders
+                for root, dirs, files in os.walk(srcpath, topdown=False):
+                    for name in files:
+                        path = _join(root, name)
+                        os.unlink(path)
+                        self.write_log("delete", path)
+                    for name in dirs:
+                        # symlinks to folders are listed as folders but not walked into
+                        path = _join(root, name)
+                        if _islink(path):
+                            os.unlink(path)
+                    os.rmdir(root)
             else:
                 os.remove(srcpath)
-                self.file_deleted_count += 1
                 self.write_log("delete", srcpath)
 
 if __name__=="__main__":
 
     # parse and run
     sync = parse_arguments()
+
+    # finish the current sync and exit cleanly on Ctrl+C / termination, a second one aborts the running sync
+    def handle_signal(signum, frame):
+        if sync._stop.is_set():
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            raise KeyboardInterrupt
+        sync.stop()
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+
     sync.compare_root()